@@ -2,17 +2,21 @@
 Script: Data Transformation for Cryptocurrency Dataset
 
 Description:
-This script processes cryptocurrency CSV files to:
+This script processes cryptocurrency data files (Parquet or CSV) to:
 1. Compute the percent variation of every row with respect to the previous one for each feature.
 2. Normalize the dataset using Robust Scaling.
 
-Features are transformed, excluding the class label ('Anomaly'), and the resulting dataset is saved as new CSV files.
+Features are transformed, excluding the class label ('Anomaly'), and the resulting dataset is saved as new files (Parquet by default, or CSV with `--format csv`).
 
 Execution:
 To execute this script, from the root folder, run the following command:
 
     python src/data_transformation.py --input_folder /path/to/input/folder --output_folder /path/to/output/folder
 
+Files whose output is newer than the input are skipped, add the `--force` flag to process them again.
+Add the `--streaming` flag to process the files with a lazy Polars query that streams them from disk
+instead of loading them fully in memory (requires polars).
+
 Example:
 
     python src/data_transformation.py --input_folder data/with_indicators --output_folder data/transformed
@@ -23,97 +27,252 @@ import pandas as pd
 import numpy as np
 import argparse
 import os
-import glob
-from sklearn.preprocessing import RobustScaler
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io_utils import FILE_FORMATS, PARSE_DATES, list_data_files, output_file_path, read_frame, select_outdated_files, write_frame
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# Exclude columns from transformations
+# Also the Volumne is excluded to avoid
+# Input X contains infinity or a value too large for dtype('float64'), which can be caused by
+# the Volume column having a value of 0 and so the pct_change is infinite
+EXCLUDE_COLUMNS_PCT = ['Datetime', 'Date', 'Anomaly', 'Volume']
+EXCLUDE_COLUMNS_SCALER = ['Datetime', 'Date', 'Anomaly']
+
+# Types of the price columns, applied while reading CSV files
+DTYPES = {'Open': 'float32', 'High': 'float32', 'Low': 'float32', 'Close': 'float32', 'Adj Close': 'float32', 'Volume': 'float64'}
+
+def column_quantiles(arr, quantiles):
+    """
+    Computes quantiles of each column with linear interpolation, as np.percentile does, but
+    selecting only the needed elements with np.partition instead of sorting the columns.
+
+    Parameters:
+    arr (numpy.ndarray): 2D float array with only finite values.
+    quantiles (list): Quantiles to compute, between 0 and 1.
+
+    Returns:
+    numpy.ndarray: Array with one row per quantile and one column per column of arr.
+    """
+    positions = np.asarray(quantiles) * (arr.shape[0] - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.ceil(positions).astype(int)
+    weights = (positions - lower)[:, np.newaxis]
+
+    part = np.partition(arr, np.unique(np.concatenate([lower, upper])), axis=0)
 
-def compute_percent_variation(df, exclude_columns):
+    return (part[lower] * (1 - weights) + part[upper] * weights).astype(arr.dtype)
+
+def robust_scale_matrix(arr, finite=False):
     """
-    Computes the percent variation of each feature with respect to the previous row.
+    Scales the columns of a matrix in place, removing the median and dividing by the
+    interquartile range (same statistics as sklearn's RobustScaler).
 
     Parameters:
-    df (pandas.DataFrame): The input DataFrame.
-    exclude_columns (list): List of columns to exclude from the computation.
+    arr (numpy.ndarray): 2D float array of features (rows x columns).
+    finite (bool): Whether the caller already knows that the array has no NaN or infinite values.
 
     Returns:
-    pandas.DataFrame: DataFrame with percent variation computed.
+    numpy.ndarray: The same array, scaled.
     """
-    df = df.copy()
-    # Columns to compute percent variation on
-    columns = [col for col in df.columns if col not in exclude_columns]
+    if arr.shape[0] == 0:
+        return arr
+
+    # The partition can only replace np.percentile when there are no NaN or infinite values
+    if finite:
+        q25, q50, q75 = column_quantiles(arr, [0.25, 0.5, 0.75])
+    else:
+        q25, q50, q75 = np.nanpercentile(arr, [25, 50, 75], axis=0)
+    iqr = q75 - q25
+    # Constant features are only centered, as done by RobustScaler
+    iqr[iqr < 10 * np.finfo(iqr.dtype).eps] = 1.0
 
-    # Compute percent variation
-    for col in columns:
-        df[f"{col}_pct_change"] = df[col].pct_change()
+    np.subtract(arr, q50, out=arr)
+    np.divide(arr, iqr, out=arr)
 
-    # Drop the first row which will have NaN values after pct_change
-    df.dropna(inplace=True)
+    return arr
 
-    return df
+def transform_matrix(values, pct_index):
+    """
+    Computes the percent variation of the selected features and robust scales the whole
+    feature matrix, working on a single preallocated array instead of intermediate DataFrames.
+
+    Parameters:
+    values (numpy.ndarray): 2D float array of features (rows x columns).
+    pct_index (list): Indices of the columns to compute the percent variation on.
 
-def robust_scaling(df, exclude_columns):
+    Returns:
+    tuple: Scaled matrix with the features followed by their percent variations, and the boolean
+    mask of the rows after the first one (which has no previous row to compare with) kept in it.
+    As before with dropna and RobustScaler, rows with missing values are dropped, while
+    infinite values (e.g. percent variation of a zero value) raise a ValueError.
+    """
+    n_rows, n_cols = values.shape
+    out = np.empty((max(n_rows - 1, 0), n_cols + len(pct_index)), dtype=values.dtype)
+
+    # Features, aligned with the rows having a percent variation
+    out[:, :n_cols] = values[1:]
+
+    # Percent variation with respect to the previous row, computed as (current - previous) / previous:
+    # the difference of two close values is exact, while current / previous - 1 would lose
+    # most of the float32 precision of small variations
+    pct = out[:, n_cols:]
+    previous = values[:-1, pct_index]
+    np.subtract(values[1:, pct_index], previous, out=pct)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(pct, previous, out=pct)
+
+    kept_rows = np.ones(len(out), dtype=bool)
+    if not np.isfinite(out).all():
+        # Drop the rows with missing values (e.g. percent variation of 0 over 0)
+        kept_rows = ~np.isnan(out).any(axis=1)
+        out = out[kept_rows]
+        # Infinite values cannot be scaled, the file is rejected as done by RobustScaler
+        if np.isinf(out).any():
+            raise ValueError(f"Input X contains infinity or a value too large for dtype('{out.dtype}').")
+
+    return robust_scale_matrix(out, finite=True), kept_rows
+
+def process_file(file_path, output_folder, file_format='parquet'):
     """
-    Scales the features using Robust Scaler.
+    Process a single data file to compute percent variation and normalize the data.
 
     Parameters:
-    df (pandas.DataFrame): The input DataFrame.
-    exclude_columns (list): List of columns to exclude from scaling.
+    file_path (str): Path to the CSV or Parquet file.
+    output_folder (str): Path to the output folder.
+    file_format (str): Format of the saved file ('parquet' or 'csv').
 
     Returns:
-    pandas.DataFrame: Scaled DataFrame.
+    None
     """
-    df = df.copy()
-    # Columns to scale
-    columns = [col for col in df.columns if col not in exclude_columns]
+    print(f"Processing file: {os.path.basename(file_path)}")
+    try:
+        # The datetime column is parsed, and the prices read as float32, while reading the file
+        df = read_frame(file_path, dtype=DTYPES, parse_dates=PARSE_DATES)
+
+        if 'Datetime' not in df.columns and 'Date' not in df.columns:
+            print(f"No 'Datetime' or 'Date' column found in '{file_path}'. Skipping file.")
+            return
+
+        # Prices and indicators fit in float32 precision, which halves the memory traffic of the
+        # transformations. Volume is kept in float64 since it is orders of magnitude larger than the prices
+        float_columns = df.select_dtypes('float64').columns.drop('Volume', errors='ignore')
+        df[float_columns] = df[float_columns].astype(np.float32)
+
+        feature_columns = [col for col in df.columns if col not in EXCLUDE_COLUMNS_SCALER]
+        pct_columns = [col for col in feature_columns if col not in EXCLUDE_COLUMNS_PCT]
+
+        # Clip the Volume to the float32 range, so that it cannot overflow in the float32 feature matrix
+        if 'Volume' in feature_columns:
+            df['Volume'] = df['Volume'].clip(upper=np.finfo(np.float32).max)
+
+        # Compute percent variation and normalize using Robust Scaling in a single pass
+        scaled, kept_rows = transform_matrix(
+            df[feature_columns].to_numpy(dtype=np.float32),
+            [feature_columns.index(col) for col in pct_columns],
+        )
+        df_robust_scaled = pd.DataFrame(scaled, columns=feature_columns + [f"{col}_pct_change" for col in pct_columns])
 
-    # Initialize the RobustScaler
-    scaler = RobustScaler()
+        # Put back the excluded columns in their original position
+        for position, col in enumerate(df.columns):
+            if col in EXCLUDE_COLUMNS_SCALER:
+                df_robust_scaled.insert(position, col, df[col].to_numpy()[1:][kept_rows])
 
-    # Fit and transform the data
-    df[columns] = scaler.fit_transform(df[columns])
+        # Save the transformed dataset
+        base_filename = os.path.basename(file_path).split('.')[0]
+        output_file_robust = output_file_path(file_path, output_folder, file_format, suffix='_robust_scaled')
+
+        write_frame(df_robust_scaled, output_file_robust)
+
+        print(f"Processed and saved file for '{base_filename}':")
+        print(f" - Robust Scaled: {output_file_robust}")
 
-    return df
+    except Exception as e:
+        print(f"Error processing file '{file_path}': {e}")
 
-def process_file(file_path, output_folder):
+def process_file_streaming(file_path, output_folder, file_format='parquet'):
     """
-    Process a single CSV file to compute percent variation and normalize the data.
+    Process a single data file like process_file, but through a lazy Polars query which
+    reads, transforms and writes the data in streaming mode instead of loading the whole file.
 
     Parameters:
-    file_path (str): Path to the CSV file.
+    file_path (str): Path to the CSV or Parquet file.
     output_folder (str): Path to the output folder.
+    file_format (str): Format of the saved file ('parquet' or 'csv').
 
     Returns:
     None
     """
+    print(f"Processing file: {os.path.basename(file_path)}")
     try:
-        df = pd.read_csv(file_path)
+        if pl is None:
+            raise ImportError("polars is required to process files in streaming mode")
 
-        # Ensure datetime column is in datetime format
-        if 'Datetime' in df.columns:
-            df['Datetime'] = pd.to_datetime(df['Datetime'])
-        elif 'Date' in df.columns:
-            df['Date'] = pd.to_datetime(df['Date'])
+        if file_path.endswith('.parquet'):
+            lf = pl.scan_parquet(file_path)
         else:
+            lf = pl.scan_csv(file_path, try_parse_dates=True)
+        columns = lf.collect_schema().names()
+
+        if 'Datetime' not in columns and 'Date' not in columns:
             print(f"No 'Datetime' or 'Date' column found in '{file_path}'. Skipping file.")
             return
 
-        # Exclude columns from transformations
-        # Also the Volumne is excluded to avoid
-        # Input X contains infinity or a value too large for dtype('float64'), which can be caused by
-        # the Volume column having a value of 0 and so the pct_change is infinite
-        exclude_columns_pct = ['Datetime', 'Date', 'Anomaly', 'Volume']
-        exclude_columns_scaler = ['Datetime', 'Date', 'Anomaly']
-
-        # Compute percent variation
-        df = compute_percent_variation(df, exclude_columns_pct)
-
-        # Normalize using Robust Scaling
-        df_robust_scaled = robust_scaling(df, exclude_columns_scaler)
+        feature_columns = [col for col in columns if col not in EXCLUDE_COLUMNS_SCALER]
+        pct_columns = [col for col in feature_columns if col not in EXCLUDE_COLUMNS_PCT]
+        scaled_columns = feature_columns + [f"{col}_pct_change" for col in pct_columns]
+
+        # Same Robust Scaling as robust_scale_matrix, constant features are only centered.
+        # NaN is a value for Polars, so it is turned into null to be skipped like np.nanpercentile does
+        def robust_scale(col):
+            values = pl.col(col).fill_nan(None)
+            q25 = values.quantile(0.25, interpolation='linear')
+            q50 = values.quantile(0.5, interpolation='linear')
+            q75 = values.quantile(0.75, interpolation='linear')
+            iqr = q75 - q25
+            iqr = pl.when(iqr < 10 * np.finfo(np.float32).eps).then(1.0).otherwise(iqr)
+            return ((pl.col(col) - q50) / iqr).cast(pl.Float32).alias(col)
+
+        # Same float32 features as process_file, with the Volume clipped to the float32 range
+        def to_float32(col):
+            if col == 'Volume':
+                return pl.col(col).cast(pl.Float64).clip(upper_bound=float(np.finfo(np.float32).max)).cast(pl.Float32)
+            return pl.col(col).cast(pl.Float32)
+
+        # Same percent variation as transform_matrix, (current - previous) / previous
+        def percent_variation(col):
+            previous = pl.col(col).shift(1)
+            return ((pl.col(col) - previous) / previous).alias(f"{col}_pct_change")
+
+        lf = (
+            lf
+            .with_columns([to_float32(col) for col in feature_columns])
+            .with_columns([percent_variation(col) for col in pct_columns])
+            # Drop the first row, which has no previous row to compute the percent variation
+            .slice(1)
+            # Drop the rows with missing values, as transform_matrix does
+            .filter(~pl.any_horizontal([pl.col(col).is_null() | pl.col(col).is_nan() for col in scaled_columns]))
+        )
+
+        # Infinite values cannot be scaled, the file is rejected as done by transform_matrix
+        has_infinity = lf.select(pl.any_horizontal([pl.col(col).is_infinite().any() for col in scaled_columns])).collect().item()
+        if has_infinity:
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+
+        lf = lf.with_columns([robust_scale(col) for col in scaled_columns])
 
         # Save the transformed dataset
         base_filename = os.path.basename(file_path).split('.')[0]
-        output_file_robust = os.path.join(output_folder, f"{base_filename}_robust_scaled.csv")
+        output_file_robust = output_file_path(file_path, output_folder, file_format, suffix='_robust_scaled')
 
-        df_robust_scaled.to_csv(output_file_robust, index=False)
+        if file_format == 'parquet':
+            lf.sink_parquet(output_file_robust, compression='zstd')
+        else:
+            lf.sink_csv(output_file_robust)
 
         print(f"Processed and saved file for '{base_filename}':")
         print(f" - Robust Scaled: {output_file_robust}")
@@ -124,12 +283,16 @@ def process_file(file_path, output_folder):
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Compute percent variation and normalize cryptocurrency data.')
-    parser.add_argument('--input_folder', required=True, help='Folder containing the CSV files to process.')
-    parser.add_argument('--output_folder', required=True, help='Folder where transformed CSV files will be saved.')
+    parser.add_argument('--input_folder', required=True, help='Folder containing the CSV or Parquet files to process.')
+    parser.add_argument('--output_folder', required=True, help='Folder where transformed files will be saved.')
+    parser.add_argument('--format', choices=FILE_FORMATS, default=FILE_FORMATS[0], help='Format of the saved files (default: parquet).')
+    parser.add_argument('--force', action='store_true', help='Process all the files, even if their output is up to date.')
+    parser.add_argument('--streaming', action='store_true', help='Stream the files with Polars instead of loading them in memory.')
     args = parser.parse_args()
 
     input_folder = args.input_folder
     output_folder = args.output_folder
+    file_format = args.format
 
     # Ensure the output folder exists
     if not os.path.exists(output_folder):
@@ -140,19 +303,25 @@ def main():
             print(f"Error creating output folder '{output_folder}': {e}")
             return
 
-    # Process each CSV file in the input folder
-    csv_files = glob.glob(os.path.join(input_folder, '*.csv'))
+    # Process each data file in the input folder
+    data_files = list_data_files(input_folder)
 
-    if not csv_files:
-        print(f"No CSV files found in '{input_folder}'.")
+    if not data_files:
+        print(f"No CSV or Parquet files found in '{input_folder}'.")
         return
 
-    for file_path in csv_files:
-        print(f"Processing file: {os.path.basename(file_path)}")
-        # Avoid all the files with full_data in the name
-        if 'full_data' in file_path:
-            continue
-        process_file(file_path, output_folder)
+    # Avoid all the files with full_data in the name
+    data_files = [file_path for file_path in data_files if 'full_data' not in file_path]
+
+    # Skip the files already transformed since their last change
+    if not args.force:
+        data_files = select_outdated_files(data_files, output_folder, file_format, suffix='_robust_scaled')
+
+    process = process_file_streaming if args.streaming else process_file
+
+    # The files are independent, so they are processed in parallel on all the available cores
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(partial(process, output_folder=output_folder, file_format=file_format), data_files))
 
 if __name__ == '__main__':
     main()
@@ -3,9 +3,9 @@ Script: Cryptocurrency Data Downloader and Cleaner
 
 Description:
 This script downloads cryptocurrency data from Yahoo Finance, cleans the data by 
-handling missing values (using forward-fill), and saves the cleaned data into CSV files.
+handling missing values (using forward-fill), and saves the cleaned data into Parquet (default) or CSV files.
 The user must specify the cryptocurrency tickers, the period, the interval, and the 
-output folder where the CSV files will be saved.
+output folder where the files will be saved.
 
 Requirements:
 A conda environment is required to run this script. You can create a new conda environment by running the following command:
@@ -22,7 +22,8 @@ To execute this script from the root folder, run the following command in your t
 - --tickers: Space-separated cryptocurrency tickers (e.g., BTC ETH).
 - --period: Time period to retrieve data (e.g., '7d', '1mo').
 - --interval: Data interval (e.g., '1h', '1d').
-- --output_folder: The path to the folder where the CSV files will be saved.
+- --output_folder: The path to the folder where the files will be saved.
+- --format: Format of the saved files, 'parquet' (default) or 'csv'.
 
 Example:
     python src/dataset_acquisition.py --tickers BTC BTS DGB XMR DASH DOGE ETH LTC MAID MONA NAV VTC XCP XRP SYS XLM --output_folder data/raw --period ytd --interval 1h
@@ -33,38 +34,53 @@ import yfinance as yf
 import pandas as pd
 import argparse
 import os
+from io_utils import FILE_FORMATS, write_frame
 
 
-def download_crypto_data(ticker, period='ytd', interval='1h'):
+def download_crypto_data(tickers, period='ytd', interval='1h'):
     """
-    Download historical data for a given cryptocurrency ticker from Yahoo Finance.
+    Download historical data for a list of cryptocurrency tickers from Yahoo Finance,
+    retrieving all the tickers with a single batched request.
     
     Parameters:
-    ticker (str): Cryptocurrency ticker symbol.
+    tickers (list): Cryptocurrency ticker symbols.
     period (str): Data period to download.
     interval (str): Data interval (e.g., '1h' for hourly data).
     
     Returns:
-    pandas.DataFrame or None: DataFrame containing the historical data, or None if data is not available.
+    dict: DataFrame containing the historical data for each ticker with available data.
     """
-    # Construct Yahoo Finance ticker symbol (e.g., 'BTC-USD')
-    yahoo_ticker = f"{ticker}-USD"
+    # Construct Yahoo Finance ticker symbols (e.g., 'BTC-USD')
+    yahoo_tickers = [f"{ticker}-USD" for ticker in tickers]
     
     try:
-        # Download data from Yahoo Finance
-        data = yf.download(tickers=yahoo_ticker, period=period, interval=interval)
+        # Download data from Yahoo Finance, with the columns grouped by ticker
+        data = yf.download(tickers=yahoo_tickers, period=period, interval=interval, group_by='ticker', threads=True)
+    except Exception as e:
+        print(f"Error downloading data for {', '.join(yahoo_tickers)}: {e}")
+        return {}
+    
+    all_data = {}
+    for ticker, yahoo_ticker in zip(tickers, yahoo_tickers):
+        if isinstance(data.columns, pd.MultiIndex):
+            if yahoo_ticker not in data.columns.get_level_values(0):
+                print(f"No data found for {yahoo_ticker}.")
+                continue
+            ticker_data = data[yahoo_ticker]
+        else:
+            ticker_data = data
+        
+        # Drop the rows where only the other tickers have data
+        ticker_data = ticker_data.dropna(how='all')
         
         # Check if data is empty
-        if data.empty:
+        if ticker_data.empty:
             print(f"No data found for {yahoo_ticker}.")
-            return None
         else:
             # Reset index to have DateTime as a column
-            data.reset_index(inplace=True)
-            return data
-    except Exception as e:
-        print(f"Error downloading data for {yahoo_ticker}: {e}")
-        return None
+            all_data[ticker] = ticker_data.reset_index()
+    
+    return all_data
 
 def fill_missing_values(data):
     """
@@ -95,9 +111,10 @@ def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Download and process cryptocurrency data.')
     parser.add_argument('--tickers', nargs='+', required=True, help='List of cryptocurrency ticker symbols.')
-    parser.add_argument('--output_folder', required=True, help='Folder where CSV files will be saved.')
+    parser.add_argument('--output_folder', required=True, help='Folder where the files will be saved.')
     parser.add_argument('--period', default='ytd', help='Data period to download (e.g., "ytd").')
     parser.add_argument('--interval', default='1h', help='Data interval (e.g., "1h" for hourly data").')
+    parser.add_argument('--format', choices=FILE_FORMATS, default=FILE_FORMATS[0], help='Format of the saved files (default: parquet).')
     
     # Parse arguments
     args = parser.parse_args()
@@ -106,6 +123,7 @@ def main():
     output_folder = args.output_folder
     period = args.period
     interval = args.interval
+    file_format = args.format
     
     # Ensure the output folder exists
     if not os.path.exists(output_folder):
@@ -116,14 +134,16 @@ def main():
             print(f"Error creating output folder '{output_folder}': {e}")
             return
     
+    # Download data for all the tickers at once
+    downloaded_data = download_crypto_data(tickers, period=period, interval=interval)
+    
     # Dictionary to store data for each ticker
     all_data = {}
     
     for ticker in tickers:
         print(f"Processing data for {ticker}...")
         
-        # Download data
-        data = download_crypto_data(ticker, period=period, interval=interval)
+        data = downloaded_data.get(ticker)
         
         if data is not None:
             # Fill missing values
@@ -132,10 +152,10 @@ def main():
             # Store the cleaned data
             all_data[ticker] = data_filled
             
-            # Save data to CSV
-            filename = os.path.join(output_folder, f"{ticker}_data.csv")
+            # Save data to file
+            filename = os.path.join(output_folder, f"{ticker}_data.{file_format}")
             try:
-                data_filled.to_csv(filename, index=False)
+                write_frame(data_filled, filename)
                 print(f"Data for {ticker} saved to {filename}.")
             except Exception as e:
                 print(f"Error saving data for {ticker} to '{filename}': {e}")
@@ -144,10 +164,10 @@ def main():
     
     # Combine all data into a single DataFrame or perform further processing and analysis
     full_data = pd.concat(all_data.values(), keys=all_data.keys(), names=['Ticker']).reset_index()
-    # Save the full data to a CSV file
-    full_filename = os.path.join(output_folder, "full_data.csv")
+    # Save the full data to a file
+    full_filename = os.path.join(output_folder, f"full_data.{file_format}")
     try:
-        full_data.to_csv(full_filename, index=False)
+        write_frame(full_data, full_filename)
         print(f"Full data saved to {full_filename}.")
     except Exception as e:
         print(f"Error saving full data to '{full_filename}': {e}")
@@ -2,7 +2,7 @@
 Script: Dataset Construction for Cryptocurrency Anomaly Detection
 
 Description:
-This script processes cryptocurrency data CSV files obtained from the data acquisition phase. It calculates the hourly close price variations, labels anomalies based on specified thresholds, applies curve shifting to label preceding hours, and handles interleaved anomalies by labeling them as stable. The goal is to prepare a dataset suitable for machine learning models to predict anomalies in cryptocurrency prices.
+This script processes cryptocurrency data files (Parquet or CSV) obtained from the data acquisition phase. It calculates the hourly close price variations, labels anomalies based on specified thresholds, applies curve shifting to label preceding hours, and handles interleaved anomalies by labeling them as stable. The goal is to prepare a dataset suitable for machine learning models to predict anomalies in cryptocurrency prices.
 
 Requirements:
 A conda environment is required to run this script. You can create a new conda environment by running the following command:
@@ -16,23 +16,28 @@ To execute this script from the root folder, run the following command in your t
 
     python src/dataset_construction.py --input_folder /path/to/input/folder --output_folder /path/to/output/folder --threshold 1.0 --shift_hours 4
 
-- `--input_folder`: The path to the folder containing the raw CSV files to process.
-- `--output_folder`: The path to the folder where the processed CSV files will be saved.
+- `--input_folder`: The path to the folder containing the raw files (Parquet or CSV) to process.
+- `--output_folder`: The path to the folder where the processed files will be saved.
 - `--threshold`: The percentage threshold for anomaly detection (e.g., 1.0 for 1% price variation).
 - `--shift_hours`: The number of hours for curve shifting (e.g., 4 hours preceding an anomaly).
+- `--format`: Format of the processed files, 'parquet' (default) or 'csv'.
+- `--force`: Process all the files, also those whose output is newer than the input (skipped by default).
 
 Example:
 
     python src/dataset_construction.py --input_folder data/raw --output_folder data/processed --threshold 1.0 --shift_hours 4
 
-This command processes all CSV files in `data/raw`, labels anomalies based on a 1% price variation threshold, applies a curve shifting of 4 hours, and saves the processed files to `data/processed`.
+This command processes all the files in `data/raw`, labels anomalies based on a 1% price variation threshold, applies a curve shifting of 4 hours, and saves the processed files to `data/processed`.
 """
 
 
-import pandas as pd
+import numpy as np
+from numba import njit
 import argparse
 import os
-import glob
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io_utils import FILE_FORMATS, list_data_files, output_file_path, read_frame, select_outdated_files, write_frame
 
 def calculate_price_variation(df):
     """
@@ -43,8 +48,9 @@ def calculate_price_variation(df):
 
     Returns:
     pandas.DataFrame: DataFrame with an additional 'Price_Variation' column.
+
+    Note: the input DataFrame is modified in place, pass a copy to keep the original one.
     """
-    df = df.copy()
     # Calculate percentage variation of close prices
     df['Price_Variation'] = df['Close'].pct_change() * 100
     return df
@@ -59,19 +65,64 @@ def label_anomalies(df, threshold=1.0):
 
     Returns:
     pandas.DataFrame: DataFrame with an additional 'Anomaly' column.
+
+    Note: the input DataFrame is modified in place, pass a copy to keep the original one.
     """
-    df = df.copy()
-    df['Anomaly'] = 0  # Initialize anomaly column with 0 (stable)
+    # Price variation of the next hour, the anomaly is labeled on the previous hour
+    next_variation = df['Price_Variation'].shift(-1).to_numpy()
+
+    df['Anomaly'] = np.select(
+        [
+            next_variation < -threshold,  # Downward anomaly
+            next_variation > threshold,  # Upward anomaly
+        ],
+        [2, 1],
+        default=0,  # Stable
+    ).astype(np.int8)
 
-    # Identify upward anomalies
-    upward_anomalies = df['Price_Variation'].shift(-1) > threshold
-    df.loc[upward_anomalies, 'Anomaly'] = 1  # Label previous hour as upward anomaly
+    return df
 
-    # Identify downward anomalies
-    downward_anomalies = df['Price_Variation'].shift(-1) < -threshold
-    df.loc[downward_anomalies, 'Anomaly'] = 2  # Label previous hour as downward anomaly
+@njit(cache=True)
+def _shift_labels(labels, shift_hours):
+    """
+    Compiled kernel of apply_curve_shifting, working on the array of anomaly labels.
 
-    return df
+    Parameters:
+    labels (numpy.ndarray): Anomaly labels (0, 1 or 2).
+    shift_hours (int): Number of hours to shift the anomaly labels backward.
+
+    Returns:
+    numpy.ndarray: Anomaly labels after curve shifting.
+    """
+    shifted = labels.copy()
+    for idx in range(len(labels)):
+        # Get the label of the current anomaly (1 or 2)
+        anomaly_label = labels[idx]
+        if anomaly_label > 0:
+            # Apply curve shifting to the previous n hours
+            shifted[max(0, idx - shift_hours):idx + 1] = anomaly_label
+    return shifted
+
+@njit(cache=True)
+def _resolve_interleaved_labels(labels):
+    """
+    Compiled kernel of handle_interleaved_anomalies, working on the array of anomaly labels.
+
+    Parameters:
+    labels (numpy.ndarray): Anomaly labels (0, 1 or 2).
+
+    Returns:
+    numpy.ndarray: Anomaly labels with interleaved anomalies set to 0 (stable).
+    """
+    resolved = labels.copy()
+    # Sequential scan: once a conflict is resolved, the next row is compared with a stable row
+    for i in range(1, len(resolved)):
+        if resolved[i] != 0 and resolved[i-1] != 0:
+            if resolved[i] != resolved[i-1]:
+                # Set both current and previous anomalies to 0 (stable)
+                resolved[i] = 0
+                resolved[i-1] = 0
+    return resolved
 
 def apply_curve_shifting(df, shift_hours=4):
     """
@@ -83,16 +134,10 @@ def apply_curve_shifting(df, shift_hours=4):
 
     Returns:
     pandas.DataFrame: DataFrame with updated 'Anomaly' column after curve shifting.
-    """
-    df = df.copy()
-    anomaly_indices = df.index[df['Anomaly'] > 0].tolist()
 
-    for idx in anomaly_indices:
-        # Get the label of the current anomaly (1 or 2)
-        anomaly_label = df.at[idx, 'Anomaly']
-        # Apply curve shifting to the previous n hours
-        start_idx = max(0, idx - shift_hours)
-        df.loc[start_idx:idx, 'Anomaly'] = anomaly_label
+    Note: the input DataFrame is modified in place, pass a copy to keep the original one.
+    """
+    df['Anomaly'] = _shift_labels(df['Anomaly'].to_numpy(), shift_hours)
 
     return df
 
@@ -105,23 +150,19 @@ def handle_interleaved_anomalies(df):
 
     Returns:
     pandas.DataFrame: DataFrame with updated 'Anomaly' column after handling interleaved anomalies.
+
+    Note: the input DataFrame is modified in place, pass a copy to keep the original one.
     """
-    df = df.copy()
-    anomaly_series = df['Anomaly']
-    for i in range(1, len(anomaly_series)):
-        if anomaly_series[i] != 0 and anomaly_series[i-1] != 0:
-            if anomaly_series[i] != anomaly_series[i-1]:
-                # Set both current and previous anomalies to 0 (stable)
-                df.at[i, 'Anomaly'] = 0
-                df.at[i-1, 'Anomaly'] = 0
+    df['Anomaly'] = _resolve_interleaved_labels(df['Anomaly'].to_numpy())
+
     return df
 
 def process_file(file_path, threshold, shift_hours):
     """
-    Process a single CSV file to label anomalies.
+    Process a single data file to label anomalies.
 
     Parameters:
-    file_path (str): Path to the CSV file.
+    file_path (str): Path to the CSV or Parquet file.
     threshold (float): The percentage threshold to consider for anomalies.
     shift_hours (int): Number of hours to shift the anomaly labels backward.
 
@@ -129,7 +170,8 @@ def process_file(file_path, threshold, shift_hours):
     pandas.DataFrame: Processed DataFrame with anomalies labeled.
     """
     try:
-        df = pd.read_csv(file_path)
+        df = read_frame(file_path)
+        # The steps update the freshly read DataFrame in place, so no copy is made along the way
         df = calculate_price_variation(df)
         df = label_anomalies(df, threshold=threshold)
         df = apply_curve_shifting(df, shift_hours=shift_hours)
@@ -139,19 +181,50 @@ def process_file(file_path, threshold, shift_hours):
         print(f"Error processing file '{file_path}': {e}")
         return None
 
+def process_and_save_file(file_path, output_folder, threshold, shift_hours, file_format='parquet'):
+    """
+    Process a single data file to label anomalies and save the result in the output folder.
+
+    Parameters:
+    file_path (str): Path to the CSV or Parquet file.
+    output_folder (str): Path to the output folder.
+    threshold (float): The percentage threshold to consider for anomalies.
+    shift_hours (int): Number of hours to shift the anomaly labels backward.
+    file_format (str): Format of the saved file ('parquet' or 'csv').
+
+    Returns:
+    None
+    """
+    file_name = os.path.basename(file_path)
+    print(f"Processing file: {file_name}")
+    df_processed = process_file(file_path, threshold, shift_hours)
+
+    if df_processed is not None:
+        output_file = output_file_path(file_path, output_folder, file_format)
+        try:
+            write_frame(df_processed, output_file)
+            print(f"Processed data saved to '{output_file}'.")
+        except Exception as e:
+            print(f"Error saving processed data to '{output_file}': {e}")
+    else:
+        print(f"Skipping file '{file_name}' due to processing error.")
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Construct dataset by labeling anomalies in cryptocurrency data.')
-    parser.add_argument('--input_folder', required=True, help='Folder containing the CSV files to process.')
-    parser.add_argument('--output_folder', required=True, help='Folder where processed CSV files will be saved.')
+    parser.add_argument('--input_folder', required=True, help='Folder containing the CSV or Parquet files to process.')
+    parser.add_argument('--output_folder', required=True, help='Folder where processed files will be saved.')
     parser.add_argument('--threshold', type=float, default=1.0, help='Percentage threshold for anomaly detection.')
     parser.add_argument('--shift_hours', type=int, default=4, help='Number of hours for curve shifting.')
+    parser.add_argument('--format', choices=FILE_FORMATS, default=FILE_FORMATS[0], help='Format of the saved files (default: parquet).')
+    parser.add_argument('--force', action='store_true', help='Process all the files, even if their output is up to date.')
     args = parser.parse_args()
 
     input_folder = args.input_folder
     output_folder = args.output_folder
     threshold = args.threshold
     shift_hours = args.shift_hours
+    file_format = args.format
 
     # Ensure the output folder exists
     if not os.path.exists(output_folder):
@@ -162,27 +235,23 @@ def main():
             print(f"Error creating output folder '{output_folder}': {e}")
             return
 
-    # Process each CSV file in the input folder
-    csv_files = glob.glob(os.path.join(input_folder, '*.csv'))
+    # Process each data file in the input folder
+    data_files = list_data_files(input_folder)
 
-    if not csv_files:
-        print(f"No CSV files found in '{input_folder}'.")
+    if not data_files:
+        print(f"No CSV or Parquet files found in '{input_folder}'.")
         return
 
-    for file_path in csv_files:
-        file_name = os.path.basename(file_path)
-        print(f"Processing file: {file_name}")
-        df_processed = process_file(file_path, threshold, shift_hours)
-
-        if df_processed is not None:
-            output_file = os.path.join(output_folder, file_name)
-            try:
-                df_processed.to_csv(output_file, index=False)
-                print(f"Processed data saved to '{output_file}'.")
-            except Exception as e:
-                print(f"Error saving processed data to '{output_file}': {e}")
-        else:
-            print(f"Skipping file '{file_name}' due to processing error.")
+    # Skip the files already processed since their last change
+    if not args.force:
+        data_files = select_outdated_files(data_files, output_folder, file_format)
+
+    # The files are independent, so they are processed in parallel on all the available cores
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(
+            partial(process_and_save_file, output_folder=output_folder, threshold=threshold, shift_hours=shift_hours, file_format=file_format),
+            data_files,
+        ))
 
 if __name__ == '__main__':
     try:
@@ -2,8 +2,8 @@
 Script: Technical Indicators and Sentiment Integration for Cryptocurrency Data
 
 Description:
-This script processes cryptocurrency data CSV files, calculates various technical indicators and integrates them into the existing CSV files.
-The updated CSV files will contain new columns for each technical indicator.
+This script processes cryptocurrency data files (Parquet or CSV), calculates various technical indicators and integrates them into the existing data.
+The updated files will contain new columns for each technical indicator.
 
 Requirements:
 A conda environment is required to run this script. You can create a new conda environment by running the following command:
@@ -17,8 +17,10 @@ To execute this script from the root folder, run the following command in your t
 
     python integrate_indicators.py --input_folder /path/to/input/folder --output_folder /path/to/output/folder
 
-- `--input_folder`: The path to the folder containing the CSV files to process.
-- `--output_folder`: The path to the folder where the updated CSV files will be saved.
+- `--input_folder`: The path to the folder containing the files (Parquet or CSV) to process.
+- `--output_folder`: The path to the folder where the updated files will be saved.
+- `--format`: Format of the updated files, 'parquet' (default) or 'csv'.
+- `--force`: Process all the files, also those whose output is newer than the input (skipped by default).
 
 Example:
 
@@ -29,10 +31,108 @@ import pandas as pd
 import pandas_ta as ta
 import argparse
 import os
-import glob
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import requests
 from datetime import datetime, timedelta
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+from io_utils import FILE_FORMATS, PARSE_DATES, list_data_files, output_file_path, read_frame, select_outdated_files, write_frame
+
+# Periods used for the SMA, EMA, RSI and CMO indicators
+INDICATOR_PERIODS = [5,12,13,14,20,21,26,30,50,100,200]
+
+
+def simple_moving_averages(close, periods):
+    """
+    Calculates the Simple Moving Average of the close prices for several periods,
+    deriving all of them from a single cumulative sum.
+
+    Parameters:
+    close (numpy.ndarray): Close prices.
+    periods (list): Periods of the moving averages.
+
+    Returns:
+    dict: Moving average (numpy.ndarray) for each period, NaN where the window is incomplete.
+    """
+    cumsum = np.concatenate(([0.0], np.cumsum(close)))
+    smas = {}
+    for period in periods:
+        sma = np.full(len(close), np.nan)
+        if period <= len(close):
+            sma[period - 1:] = (cumsum[period:] - cumsum[:-period]) / period
+        smas[period] = sma
+    return smas
+
+
+def exponential_moving_averages(close, periods):
+    """
+    Calculates the Exponential Moving Average of the close prices for several periods.
+    As in pandas_ta, each average is seeded with the SMA of the first period values
+    and then follows the recurrence ema[i] = alpha * close[i] + (1 - alpha) * ema[i - 1].
+
+    Parameters:
+    close (numpy.ndarray): Close prices.
+    periods (list): Periods of the moving averages.
+
+    Returns:
+    dict: Moving average (numpy.ndarray) for each period, NaN before the seed.
+    """
+    emas = {}
+    for period in periods:
+        ema = np.full(len(close), np.nan)
+        if period <= len(close):
+            alpha = 2 / (period + 1)
+            seed = close[:period].mean()
+            ema[period - 1] = seed
+            if period < len(close):
+                ema[period:], _ = lfilter([alpha], [1, alpha - 1], close[period:], zi=[(1 - alpha) * seed])
+        emas[period] = ema
+    return emas
+
+
+def bollinger_bands(close, length=5, std=2.0):
+    """
+    Calculates the Bollinger Bands of the close prices, with the same defaults and columns as pandas_ta.bbands.
+    The rolling mean and standard deviation are computed over a sliding window view of the prices,
+    which does not copy the data.
+
+    Parameters:
+    close (numpy.ndarray): Close prices.
+    length (int): Period of the moving average.
+    std (float): Number of standard deviations of the bands from the moving average.
+
+    Returns:
+    dict: Lower band, middle band, upper band, bandwidth and percent (numpy.ndarray), NaN where the window is incomplete.
+    """
+    mid = np.full(len(close), np.nan)
+    deviation = np.full(len(close), np.nan)
+    if length <= len(close):
+        windows = sliding_window_view(close, length)
+        mid[length - 1:] = windows.mean(axis=1)
+        deviation[length - 1:] = windows.std(axis=1)
+
+    lower = mid - std * deviation
+    upper = mid + std * deviation
+
+    # As in pandas_ta, ranges are shifted by the machine epsilon when any of them is zero
+    def non_zero_range(high, low):
+        diff = high - low
+        if (diff == 0).any():
+            diff += np.finfo(np.float64).eps
+        return diff
+
+    band_range = non_zero_range(upper, lower)
+
+    suffix = f"_{length}_{float(std)}"
+    return {
+        f'BBL{suffix}': lower,
+        f'BBM{suffix}': mid,
+        f'BBU{suffix}': upper,
+        f'BBB{suffix}': 100 * band_range / mid,
+        f'BBP{suffix}': non_zero_range(close, lower) / band_range,
+    }
 
 
 def integrate_technical_indicators(df):
@@ -44,8 +144,9 @@ def integrate_technical_indicators(df):
 
     Returns:
     pandas.DataFrame: DataFrame with technical indicators added.
+
+    Note: the input DataFrame is modified in place, pass a copy to keep the original one.
     """
-    df = df.copy()
     # Ensure datetime column is in datetime format
     if 'Datetime' in df.columns:
         df['Datetime'] = pd.to_datetime(df['Datetime'])
@@ -62,40 +163,50 @@ def integrate_technical_indicators(df):
         print("No 'Datetime' or 'Date' column found.")
         return df
 
+    close = df['Close']
+    # The indicators are collected and added to the DataFrame at once, since inserting
+    # the columns one by one copies and fragments the DataFrame at every new column
+    indicators = []
+
+    close_values = close.to_numpy(dtype=np.float64)
+
     # Calculate SMA for different periods
-    sma_periods = [5,12,13,14,20,21,26,30,50,100,200]
-    for period in sma_periods:
-        df[f'SMA_{period}'] = ta.sma(df['Close'], length=period)
+    sma_periods = INDICATOR_PERIODS
+    for period, sma in simple_moving_averages(close_values, sma_periods).items():
+        indicators.append(pd.Series(sma, index=df.index, name=f'SMA_{period}'))
 
     # Calculate EMA for different periods
     ema_periods = sma_periods  # Using the same periods as SMA
-    for period in ema_periods:
-        df[f'EMA_{period}'] = ta.ema(df['Close'], length=period)
+    for period, ema in exponential_moving_averages(close_values, ema_periods).items():
+        indicators.append(pd.Series(ema, index=df.index, name=f'EMA_{period}'))
 
     # Calculate MACD
-    df['MACD'] = ta.macd(df['Close']).iloc[:, 0]  # MACD line
-    df['MACD_signal'] = ta.macd(df['Close']).iloc[:, 1]  # Signal line
-    df['MACD_diff'] = ta.macd(df['Close']).iloc[:, 2]  # MACD histogram
+    macd = ta.macd(close)
+    indicators.append(macd.iloc[:, 0].rename('MACD'))  # MACD line
+    indicators.append(macd.iloc[:, 1].rename('MACD_signal'))  # Signal line
+    indicators.append(macd.iloc[:, 2].rename('MACD_diff'))  # MACD histogram
 
     # Calculate RSI for different periods
     rsi_periods = sma_periods  # Using the same periods
     for period in rsi_periods:
-        df[f'RSI_{period}'] = ta.rsi(df['Close'], length=period)
+        indicators.append(ta.rsi(close, length=period).rename(f'RSI_{period}'))
 
     # Calculate Momentum (MOM)
-    df['MOM'] = ta.mom(df['Close'])
+    indicators.append(ta.mom(close).rename('MOM'))
 
     # Calculate Chande Momentum Oscillator (CMO)
     cmo_periods = sma_periods
     for period in cmo_periods:
-        df[f'CMO_{period}'] = ta.cmo(df['Close'], length=period)
+        indicators.append(ta.cmo(close, length=period).rename(f'CMO_{period}'))
 
     # Calculate Ultimate Oscillator (UO)
-    df['UO'] = ta.uo(df['High'], df['Low'], df['Close'])
+    indicators.append(ta.uo(df['High'], df['Low'], close).rename('UO'))
 
     # Calculate Bollinger Bands (BBANDS)
-    bbands = ta.bbands(df['Close'])
-    df = df.join(bbands)
+    for name, band in bollinger_bands(close_values).items():
+        indicators.append(pd.Series(band, index=df.index, name=name))
+
+    df = pd.concat([df] + indicators, axis=1)
 
     # Reset index to have date as a column again
     df.reset_index(inplace=True)
@@ -105,31 +216,64 @@ def integrate_technical_indicators(df):
 
 def process_file(file_path):
     """
-    Process a single CSV file to integrate technical indicators and sentiment data.
+    Process a single data file to integrate technical indicators and sentiment data.
 
     Parameters:
-    file_path (str): Path to the CSV file.
+    file_path (str): Path to the CSV or Parquet file.
 
     Returns:
     pandas.DataFrame: Processed DataFrame with indicators and sentiment data.
     """
     try:
-        df = pd.read_csv(file_path)
+        df = read_frame(file_path, parse_dates=PARSE_DATES)
         df = integrate_technical_indicators(df)
         return df
     except Exception as e:
         print(f"Error processing file '{file_path}': {e}")
         return None
 
+def process_and_save_file(file_path, output_folder, file_format='parquet'):
+    """
+    Process a single data file to integrate technical indicators and save the result in the output folder.
+
+    Parameters:
+    file_path (str): Path to the CSV or Parquet file.
+    output_folder (str): Path to the output folder.
+    file_format (str): Format of the saved file ('parquet' or 'csv').
+
+    Returns:
+    None
+    """
+    file_name = os.path.basename(file_path)
+    print(f"Processing file: {file_name}")
+    df_processed = process_file(file_path)
+
+    # once all the technical indicators are calculated, it is necessary to delete all the rows with NaN values
+    # since the indicators are calculated based on historical data, the first rows will have NaN values, for example the SMA_200
+    # Alternatively, drop all rows with any missing values
+    if df_processed is not None:
+        df_clean = df_processed.dropna()
+        output_file = output_file_path(file_path, output_folder, file_format)
+        try:
+            write_frame(df_clean, output_file)
+            print(f"Processed data saved to '{output_file}'.")
+        except Exception as e:
+            print(f"Error saving processed data to '{output_file}': {e}")
+    else:
+        print(f"Skipping file '{file_name}' due to processing error.")
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Integrate technical indicators and sentiment data into cryptocurrency CSV files.')
-    parser.add_argument('--input_folder', required=True, help='Folder containing the CSV files to process.')
-    parser.add_argument('--output_folder', required=True, help='Folder where updated CSV files will be saved.')
+    parser.add_argument('--input_folder', required=True, help='Folder containing the CSV or Parquet files to process.')
+    parser.add_argument('--output_folder', required=True, help='Folder where updated files will be saved.')
+    parser.add_argument('--format', choices=FILE_FORMATS, default=FILE_FORMATS[0], help='Format of the saved files (default: parquet).')
+    parser.add_argument('--force', action='store_true', help='Process all the files, even if their output is up to date.')
     args = parser.parse_args()
 
     input_folder = args.input_folder
     output_folder = args.output_folder
+    file_format = args.format
 
     # Ensure the output folder exists
     if not os.path.exists(output_folder):
@@ -140,33 +284,20 @@ def main():
             print(f"Error creating output folder '{output_folder}': {e}")
             return
 
-    # Process each CSV file in the input folder
-    csv_files = glob.glob(os.path.join(input_folder, '*.csv'))
+    # Process each data file in the input folder
+    data_files = list_data_files(input_folder)
 
-    if not csv_files:
-        print(f"No CSV files found in '{input_folder}'.")
+    if not data_files:
+        print(f"No CSV or Parquet files found in '{input_folder}'.")
         return
 
-    for file_path in csv_files:
-        file_name = os.path.basename(file_path)
-        print(f"Processing file: {file_name}")
-        df_processed = process_file(file_path)
-
-        # once all the technical indicators are calculated, it is necessary to delete all the rows with NaN values
-        # since the indicators are calculated based on historical data, the first rows will have NaN values, for example the SMA_200
-        # Alternatively, drop all rows with any missing values
-        if df_processed is not None:
-            df_clean = df_processed.dropna()
-
-        if df_clean is not None:
-            output_file = os.path.join(output_folder, file_name)
-            try:
-                df_clean.to_csv(output_file, index=False)
-                print(f"Processed data saved to '{output_file}'.")
-            except Exception as e:
-                print(f"Error saving processed data to '{output_file}': {e}")
-        else:
-            print(f"Skipping file '{file_name}' due to processing error.")
+    # Skip the files already processed since their last change
+    if not args.force:
+        data_files = select_outdated_files(data_files, output_folder, file_format)
+
+    # The files are independent, so they are processed in parallel on all the available cores
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(partial(process_and_save_file, output_folder=output_folder, file_format=file_format), data_files))
 
 if __name__ == '__main__':
     try:
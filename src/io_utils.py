@@ -0,0 +1,183 @@
+"""
+Module: Data Files Input/Output Helpers
+
+Description:
+This module provides the helpers used by the pipeline scripts to read and write their data files.
+The intermediate files between the pipeline steps are stored as Parquet (compressed with zstd) by default,
+which keeps the column types and avoids parsing the data again at every step; CSV is still supported.
+CSV files are parsed and serialized with PyArrow, which does the work in multithreaded native code,
+instead of the default pandas engine. If PyArrow is not installed, or it cannot handle a given file,
+the helpers fall back to the default pandas engine.
+
+Usage:
+The scripts in the src folder import the helpers directly:
+
+    from io_utils import FILE_FORMATS, list_data_files, read_frame, write_frame
+"""
+
+import pandas as pd
+import glob
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Supported file formats, the first one is the default
+FILE_FORMATS = ['parquet', 'csv']
+
+# Date columns of the data files, parsed while reading CSV files
+PARSE_DATES = ['Datetime', 'Date']
+
+
+def read_csv(file_path, **kwargs):
+    """
+    Read a CSV file into a DataFrame using the PyArrow engine when available.
+
+    Parameters:
+    file_path (str): Path to the CSV file.
+    **kwargs: Additional arguments passed to pandas.read_csv.
+
+    Returns:
+    pandas.DataFrame: DataFrame with the content of the CSV file.
+    """
+    if pa is not None:
+        try:
+            return pd.read_csv(file_path, engine='pyarrow', **kwargs)
+        except (ValueError, pa.ArrowException):
+            # Options or content not supported by the PyArrow engine
+            pass
+    return pd.read_csv(file_path, **kwargs)
+
+
+def write_csv(df, file_path):
+    """
+    Write a DataFrame to a CSV file, without the index, using PyArrow when available.
+
+    Parameters:
+    df (pandas.DataFrame): DataFrame to save.
+    file_path (str): Path to the output CSV file.
+
+    Returns:
+    None
+    """
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pa_csv.write_csv(table, file_path)
+            return
+        except (ValueError, TypeError, pa.ArrowException):
+            # Column types not supported by PyArrow (e.g. mixed object columns)
+            pass
+    df.to_csv(file_path, index=False)
+
+
+def list_data_files(folder):
+    """
+    List the data files (CSV or Parquet) in a folder. When the same data is stored in both
+    formats (e.g. 'BTC_data.csv' and 'BTC_data.parquet'), only the file in the first format
+    of FILE_FORMATS is listed, since both would be saved to the same output file.
+
+    Parameters:
+    folder (str): Path to the folder.
+
+    Returns:
+    list: Paths of the data files, sorted by name.
+    """
+    files = {}
+    for file_format in FILE_FORMATS:
+        for file_path in sorted(glob.glob(os.path.join(folder, f'*.{file_format}'))):
+            base_filename = os.path.basename(file_path).split('.')[0]
+            if base_filename in files:
+                print(f"Ignoring file '{file_path}': '{files[base_filename]}' has the same name and is used instead.")
+            else:
+                files[base_filename] = file_path
+    return sorted(files.values())
+
+
+def read_frame(file_path, dtype=None, parse_dates=None):
+    """
+    Read a data file into a DataFrame, choosing the reader from the file extension.
+    Parquet files already store the column types, while for CSV files the types are
+    applied by the parser, so that the columns do not need to be converted afterwards.
+
+    Parameters:
+    file_path (str): Path to the CSV or Parquet file.
+    dtype (dict): Types of the columns of CSV files, the columns missing in the file are ignored.
+    parse_dates (list): Date columns of CSV files, the columns missing in the file are ignored.
+
+    Returns:
+    pandas.DataFrame: DataFrame with the content of the file.
+    """
+    if file_path.endswith('.parquet'):
+        return pd.read_parquet(file_path)
+
+    kwargs = {}
+    if dtype or parse_dates:
+        # Peek at the header to only pass the columns present in the file
+        columns = pd.read_csv(file_path, nrows=0).columns
+        if dtype:
+            kwargs['dtype'] = {col: col_type for col, col_type in dtype.items() if col in columns}
+        if parse_dates:
+            kwargs['parse_dates'] = [col for col in parse_dates if col in columns]
+    return read_csv(file_path, **kwargs)
+
+
+def write_frame(df, file_path):
+    """
+    Write a DataFrame to a data file, without the index, choosing the format from the file extension.
+
+    Parameters:
+    df (pandas.DataFrame): DataFrame to save.
+    file_path (str): Path to the output CSV or Parquet file.
+
+    Returns:
+    None
+    """
+    if file_path.endswith('.parquet'):
+        df.to_parquet(file_path, index=False, compression='zstd')
+    else:
+        write_csv(df, file_path)
+
+
+def output_file_path(file_path, output_folder, file_format, suffix=''):
+    """
+    Build the path of the output file produced from an input file.
+
+    Parameters:
+    file_path (str): Path to the input file.
+    output_folder (str): Path to the output folder.
+    file_format (str): Format of the output file ('parquet' or 'csv').
+    suffix (str): Suffix added to the base name of the input file.
+
+    Returns:
+    str: Path to the output file.
+    """
+    base_filename = os.path.basename(file_path).split('.')[0]
+    return os.path.join(output_folder, f"{base_filename}{suffix}.{file_format}")
+
+
+def select_outdated_files(file_paths, output_folder, file_format, suffix=''):
+    """
+    Select the input files that need to be processed, skipping those whose output file
+    already exists and is not older than the input file.
+
+    Parameters:
+    file_paths (list): Paths to the input files.
+    output_folder (str): Path to the output folder.
+    file_format (str): Format of the output files ('parquet' or 'csv').
+    suffix (str): Suffix added to the base name of the input files to get the output files.
+
+    Returns:
+    list: Paths to the input files to process.
+    """
+    outdated_files = []
+    for file_path in file_paths:
+        output_file = output_file_path(file_path, output_folder, file_format, suffix)
+        if os.path.exists(output_file) and os.path.getmtime(output_file) >= os.path.getmtime(file_path):
+            print(f"Skipping file '{os.path.basename(file_path)}': '{output_file}' is up to date.")
+        else:
+            outdated_files.append(file_path)
+    return outdated_files